@@ -1,17 +1,45 @@
+import collections
+import concurrent.futures
+import datetime
+import http.client
 import inspect
 import json
 import os
+import random
 import re
 import sys
+import threading
 import time
-import urllib.error
 import urllib.parse
-import urllib.request
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, TextIO, Tuple
 
+try:
+	import orjson
 
-@dataclass
+	def _dumps(obj: Any) -> str:
+		return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+
+	def _dumps_bytes(obj: Any) -> bytes:
+		return orjson.dumps(obj)
+
+	def _dumps_pretty(obj: Any) -> str:
+		return orjson.dumps(
+			obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2
+		).decode()
+except ImportError:
+
+	def _dumps(obj: Any) -> str:
+		return json.dumps(obj, separators=(",", ":"), sort_keys=True)
+
+	def _dumps_bytes(obj: Any) -> bytes:
+		return json.dumps(obj).encode("utf-8")
+
+	def _dumps_pretty(obj: Any) -> str:
+		return json.dumps(obj, indent=2, sort_keys=True)
+
+
+@dataclass(slots=True, frozen=True)
 class BotConfig:
 	base_url: str
 	api_key: str
@@ -66,56 +94,92 @@ def _prompt_missing(value: str, label: str, secret: bool = False) -> str:
 	return input(f"{label}: ").strip()
 
 
+# Byte-class table for .env keys: [A-Za-z0-9_.-] map to 1, everything else 0.
+_ENV_KEY_CHARS = bytes(
+	1 if chr(i).isalnum() and chr(i).isascii() or i in b"_.-" else 0 for i in range(256)
+)
+_ENV_WS = b" \t"
+
+
 def load_dotenv(path: str) -> None:
 	try:
-		with open(path, "r", encoding="utf-8") as handle:
-			for raw_line in handle:
-				line = raw_line.strip()
-				if not line or line.startswith("#") or "=" not in line:
-					continue
-				key, value = line.split("=", 1)
-				key = key.strip()
-				value = value.strip().strip('"').strip("'")
-				if key and key not in os.environ:
-					os.environ[key] = value
+		with open(path, "rb") as handle:
+			data = handle.read()
 	except FileNotFoundError:
 		return
+	if data.find(b"\r") >= 0:
+		data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+	size = len(data)
+	pos = 0
+	environ = os.environ
+	while pos < size:
+		end = data.find(b"\n", pos)
+		if end < 0:
+			end = size
+		ls = pos
+		pos = end + 1
+		while ls < end and data[ls] in _ENV_WS:
+			ls += 1
+		if ls >= end or not _ENV_KEY_CHARS[data[ls]]:
+			continue
+		eq = data.find(b"=", ls, end)
+		if eq < 0:
+			continue
+		ke = eq
+		while ke > ls and data[ke - 1] in _ENV_WS:
+			ke -= 1
+		vs = eq + 1
+		while vs < end and data[vs] in _ENV_WS:
+			vs += 1
+		ve = end
+		while ve > vs and data[ve - 1] in _ENV_WS:
+			ve -= 1
+		if ve - vs >= 2 and data[vs] == data[ve - 1] and data[vs] in b"\"'":
+			vs += 1
+			ve -= 1
+		key = data[ls:ke].decode("utf-8")
+		if key and key not in environ:
+			environ[key] = data[vs:ve].decode("utf-8")
+
+
+# Memoized env reads: name -> parsed value, so repeated load_config calls
+# skip the os.environ lookups and int/float/bool coercions.
+_ENV_MISS = object()
+_ENV_CACHE: Dict[str, Any] = {}
+
+
+def _env(name: str, default: str, cast: Any = str) -> Any:
+	value = _ENV_CACHE.get(name, _ENV_MISS)
+	if value is _ENV_MISS:
+		raw = os.environ.get(name, default)
+		value = raw if cast is str else cast(raw)
+		_ENV_CACHE[name] = value
+	return value
+
+
+def _flag_true(raw: str) -> bool:
+	return raw.lower() == "true"
+
+
+def _flag_not_false(raw: str) -> bool:
+	return raw.lower() != "false"
 
 
 def load_config() -> BotConfig:
-	load_dotenv(os.getenv("BOT_ENV_PATH", "bot/.env"))
+	load_dotenv(_env("BOT_ENV_PATH", "bot/.env"))
 	base_url = os.getenv("BOT_BASE_URL", "").rstrip("/")
 	api_key = os.getenv("BOT_API_KEY", "")
 	base_url = _prompt_missing(base_url, "BOT_BASE_URL")
 	api_key = _prompt_missing(api_key, "BOT_API_KEY", secret=True)
 	if not base_url or not api_key:
 		raise RuntimeError("BOT_BASE_URL and BOT_API_KEY are required")
-	dry_run = os.getenv("BOT_DRY_RUN", "true").lower() != "false"
-	poly_api_key = os.getenv("POLY_API_KEY", "")
-	poly_api_secret = os.getenv("POLY_API_SECRET", "")
-	poly_api_passphrase = os.getenv("POLY_API_PASSPHRASE", "")
+	dry_run = _env("BOT_DRY_RUN", "true", _flag_not_false)
+	poly_api_key = _env("POLY_API_KEY", "")
+	poly_api_secret = _env("POLY_API_SECRET", "")
+	poly_api_passphrase = _env("POLY_API_PASSPHRASE", "")
 	poly_private_key = os.getenv("POLY_PRIVATE_KEY", "")
 	poly_funder = os.getenv("POLY_FUNDER", "")
-	poly_signature_type = int(os.getenv("POLY_SIGNATURE_TYPE", "0"))
-	poly_chain_id = int(os.getenv("POLY_CHAIN_ID", "137"))
-	poly_clob_host = os.getenv("POLY_CLOB_HOST", "https://clob.polymarket.com")
-	preflight_only = os.getenv("BOT_PREFLIGHT", "false").lower() == "true"
-	preflight_condition_id = os.getenv("BOT_PREFLIGHT_CONDITION_ID", "").strip()
-	poly_usdc_token = os.getenv(
-		"POLY_USDC_TOKEN", "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"
-	)
-	poly_conditional_token = os.getenv(
-		"POLY_CONDITIONAL_TOKEN", "0x4D97DCd97eC945f40cF65F87097ACe5EA0476045"
-	)
-	low_roi_threshold = float(os.getenv("BOT_LOW_ROI_THRESHOLD", "0.72"))
-	stop_on_403 = os.getenv("BOT_STOP_ON_403", "true").lower() != "false"
-	poll_jitter_ratio = float(os.getenv("BOT_POLL_JITTER", "0.2"))
-	poll_backoff_base = float(os.getenv("BOT_POLL_BACKOFF_BASE", "2"))
-	poll_backoff_max = float(os.getenv("BOT_POLL_BACKOFF_MAX", "120"))
-	max_calls_per_hour = int(os.getenv("BOT_MAX_CALLS_PER_HOUR", "120"))
-	run_window_start = os.getenv("BOT_RUN_WINDOW_START", "")
-	run_window_end = os.getenv("BOT_RUN_WINDOW_END", "")
-	run_window_tz = os.getenv("BOT_RUN_WINDOW_TZ", "America/New_York")
+	poly_signature_type = _env("POLY_SIGNATURE_TYPE", "0", int)
 	if not dry_run:
 		poly_private_key = _prompt_missing(
 			poly_private_key, "POLY_PRIVATE_KEY", secret=True
@@ -125,55 +189,54 @@ def load_config() -> BotConfig:
 	return BotConfig(
 		base_url=base_url,
 		api_key=api_key,
-		min_grade=os.getenv("BOT_MIN_GRADE", "A"),
-		require_microstructure=os.getenv("BOT_REQUIRE_MICROSTRUCTURE", "false").lower()
-		== "true",
-		market_quality_threshold=float(
-			os.getenv("BOT_MARKET_QUALITY_THRESHOLD", "0.72")
-		),
-		window_minutes=int(os.getenv("BOT_WINDOW_MINUTES", "5")),
-		poll_seconds=int(os.getenv("BOT_POLL_SECONDS", "20")),
-		max_bets=int(os.getenv("BOT_MAX_BETS", "5")),
+		min_grade=_env("BOT_MIN_GRADE", "A"),
+		require_microstructure=_env("BOT_REQUIRE_MICROSTRUCTURE", "false", _flag_true),
+		market_quality_threshold=_env("BOT_MARKET_QUALITY_THRESHOLD", "0.72", float),
+		window_minutes=_env("BOT_WINDOW_MINUTES", "5", int),
+		poll_seconds=_env("BOT_POLL_SECONDS", "20", int),
+		max_bets=_env("BOT_MAX_BETS", "5", int),
 		dry_run=dry_run,
-		state_path=os.getenv("BOT_STATE_PATH", "bot/state.json"),
+		state_path=_env("BOT_STATE_PATH", "bot/state.json"),
 		poly_api_key=poly_api_key,
 		poly_api_secret=poly_api_secret,
 		poly_api_passphrase=poly_api_passphrase,
 		poly_private_key=poly_private_key,
 		poly_funder=poly_funder,
 		poly_signature_type=poly_signature_type,
-		poly_chain_id=poly_chain_id,
-		poly_clob_host=poly_clob_host,
-		preflight_only=preflight_only,
-		preflight_condition_id=preflight_condition_id,
-		poly_usdc_token=poly_usdc_token,
-		poly_conditional_token=poly_conditional_token,
-		low_roi_threshold=low_roi_threshold,
-		stop_on_403=stop_on_403,
-		poll_jitter_ratio=poll_jitter_ratio,
-		poll_backoff_base=poll_backoff_base,
-		poll_backoff_max=poll_backoff_max,
-		max_calls_per_hour=max_calls_per_hour,
-		run_window_start=run_window_start,
-		run_window_end=run_window_end,
-		run_window_tz=run_window_tz,
-		placed_ttl_seconds=int(os.getenv("BOT_PLACED_TTL_SECONDS", "21600")),
-		placed_event_grace_seconds=int(
-			os.getenv("BOT_PLACED_EVENT_GRACE_SECONDS", "1800")
+		poly_chain_id=_env("POLY_CHAIN_ID", "137", int),
+		poly_clob_host=_env("POLY_CLOB_HOST", "https://clob.polymarket.com"),
+		preflight_only=_env("BOT_PREFLIGHT", "false", _flag_true),
+		preflight_condition_id=_env("BOT_PREFLIGHT_CONDITION_ID", "", str.strip),
+		poly_usdc_token=_env(
+			"POLY_USDC_TOKEN", "0x2791Bca1f2de4661ED88A30C99A7a9449Aa84174"
 		),
-		paper_bankroll=float(os.getenv("BOT_PAPER_BANKROLL", "1000")),
-		kelly_fraction=float(os.getenv("BOT_KELLY_FRACTION", "0.25")),
-		max_stake=float(os.getenv("BOT_MAX_STAKE", "50")),
-		min_stake=float(os.getenv("BOT_MIN_STAKE", "1")),
-		fixed_stake=float(os.getenv("BOT_FIXED_STAKE", "0")),
-		trade_log_path=os.getenv("BOT_TRADE_LOG", "bot/trades.jsonl"),
+		poly_conditional_token=_env(
+			"POLY_CONDITIONAL_TOKEN", "0x4D97DCd97eC945f40cF65F87097ACe5EA0476045"
+		),
+		low_roi_threshold=_env("BOT_LOW_ROI_THRESHOLD", "0.72", float),
+		stop_on_403=_env("BOT_STOP_ON_403", "true", _flag_not_false),
+		poll_jitter_ratio=_env("BOT_POLL_JITTER", "0.2", float),
+		poll_backoff_base=_env("BOT_POLL_BACKOFF_BASE", "2", float),
+		poll_backoff_max=_env("BOT_POLL_BACKOFF_MAX", "120", float),
+		max_calls_per_hour=_env("BOT_MAX_CALLS_PER_HOUR", "120", int),
+		run_window_start=_env("BOT_RUN_WINDOW_START", ""),
+		run_window_end=_env("BOT_RUN_WINDOW_END", ""),
+		run_window_tz=_env("BOT_RUN_WINDOW_TZ", "America/New_York"),
+		placed_ttl_seconds=_env("BOT_PLACED_TTL_SECONDS", "21600", int),
+		placed_event_grace_seconds=_env("BOT_PLACED_EVENT_GRACE_SECONDS", "1800", int),
+		paper_bankroll=_env("BOT_PAPER_BANKROLL", "1000", float),
+		kelly_fraction=_env("BOT_KELLY_FRACTION", "0.25", float),
+		max_stake=_env("BOT_MAX_STAKE", "50", float),
+		min_stake=_env("BOT_MIN_STAKE", "1", float),
+		fixed_stake=_env("BOT_FIXED_STAKE", "0", float),
+		trade_log_path=_env("BOT_TRADE_LOG", "bot/trades.jsonl"),
 	)
 
 
 def load_state(path: str) -> Dict[str, Any]:
 	try:
-		with open(path, "r", encoding="utf-8") as handle:
-			return json.load(handle)
+		with open(path, "r", encoding="utf-8", buffering=65536) as handle:
+			return json.loads(handle.read())
 	except FileNotFoundError:
 		return {"placed": []}
 	except json.JSONDecodeError:
@@ -182,8 +245,13 @@ def load_state(path: str) -> Dict[str, Any]:
 
 def save_state(path: str, state: Dict[str, Any]) -> None:
 	os.makedirs(os.path.dirname(path), exist_ok=True)
-	with open(path, "w", encoding="utf-8") as handle:
-		json.dump(state, handle, indent=2, sort_keys=True)
+	if _env("BOT_STATE_PRETTY", "false", _flag_true):
+		text = _dumps_pretty(state)
+	else:
+		text = _dumps(state)
+	with open(path, "w", encoding="utf-8", buffering=65536) as handle:
+		handle.write(text)
+	_save_token_cache()
 
 
 def parse_event_time_seconds(raw_value: Any) -> int | None:
@@ -200,14 +268,17 @@ def parse_event_time_seconds(raw_value: Any) -> int | None:
 		text = str(raw_value).strip()
 		if not text:
 			return None
-		if re.fullmatch(r"\d+", text):
+		if text.isdigit():
 			value = int(text)
 			if value > 1_000_000_000_000:
 				value = value // 1000
 			return value if value > 0 else None
-		import datetime
-
-		normalized = text.replace("Z", "+00:00")
+		# Common ISO-8601 lengths ("...Z", "...+00:00", naive) skip the
+		# replace() when there is no trailing Z.
+		if len(text) in (19, 20, 25) and text[-1] != "Z":
+			normalized = text
+		else:
+			normalized = text.replace("Z", "+00:00")
 		dt = datetime.datetime.fromisoformat(normalized)
 		if dt.tzinfo is None:
 			dt = dt.replace(tzinfo=datetime.timezone.utc)
@@ -250,82 +321,130 @@ def prune_placed_meta(
 	ttl_seconds: int,
 	event_grace_seconds: int,
 ) -> Dict[str, Dict[str, Any]]:
+	ttl_cutoff = now_ts - ttl_seconds
+	grace_cutoff = now_ts - event_grace_seconds
 	pruned: Dict[str, Dict[str, Any]] = {}
 	for condition_id, row in meta.items():
-		event_ts = parse_event_time_seconds(row.get("eventTime"))
-		if event_ts is not None:
-			if now_ts <= event_ts + event_grace_seconds:
-				pruned[condition_id] = row
-			continue
+		event_raw = row.get("eventTime")
+		if event_raw is not None:
+			# Rows written by run_loop carry epoch-second ints; only odd
+			# shapes (ISO strings, ms epochs) need the full parser.
+			if isinstance(event_raw, int) and 0 < event_raw < 1_000_000_000_000:
+				event_ts = event_raw
+			else:
+				event_ts = parse_event_time_seconds(event_raw)
+			if event_ts is not None:
+				if event_ts >= grace_cutoff:
+					pruned[condition_id] = row
+				continue
 
-		placed_at_raw = row.get("placedAt")
-		try:
-			placed_at = int(placed_at_raw) if placed_at_raw is not None else now_ts
-		except Exception:
-			placed_at = now_ts
-		if now_ts - placed_at <= ttl_seconds:
+		placed_at = row.get("placedAt")
+		if not isinstance(placed_at, int):
+			try:
+				placed_at = int(placed_at) if placed_at is not None else now_ts
+			except (TypeError, ValueError):
+				placed_at = now_ts
+		if placed_at >= ttl_cutoff:
 			pruned[condition_id] = row
 	return pruned
 
 
-def request_json(url: str, api_key: str) -> Dict[str, Any]:
-	request = urllib.request.Request(url)
-	request.add_header("Authorization", f"Bearer {api_key}")
-	request.add_header(
-		"User-Agent",
-		"Mozilla/5.0 (compatible; PolywhalerBot/1.0; +https://workers.dev)",
-	)
-	try:
-		with urllib.request.urlopen(request, timeout=20) as response:
-			payload = response.read().decode("utf-8")
-			return json.loads(payload)
-	except urllib.error.HTTPError as exc:
-		body = ""
+USER_AGENT = "Mozilla/5.0 (compatible; PolywhalerBot/1.0; +https://workers.dev)"
+
+# Keep-alive connections keyed by (scheme, host) so repeated calls to the
+# same host reuse one TCP+TLS session instead of re-handshaking per call.
+# http.client connections are not thread-safe, so each thread (the poll
+# loop, prefetch workers) keeps its own pool.
+_conn_local = threading.local()
+
+
+def _get_connection(scheme: str, host: str) -> http.client.HTTPConnection:
+	pool: Dict[Tuple[str, str], http.client.HTTPConnection]
+	pool = getattr(_conn_local, "pool", None)
+	if pool is None:
+		pool = _conn_local.pool = {}
+	key = (scheme, host)
+	conn = pool.get(key)
+	if conn is None:
+		if scheme == "https":
+			conn = http.client.HTTPSConnection(host, timeout=20)
+		else:
+			conn = http.client.HTTPConnection(host, timeout=20)
+		pool[key] = conn
+	return conn
+
+
+def _drop_connection(scheme: str, host: str) -> None:
+	pool = getattr(_conn_local, "pool", None)
+	if pool is None:
+		return
+	conn = pool.pop((scheme, host), None)
+	if conn is not None:
 		try:
-			body = exc.read().decode("utf-8")
-		except Exception:
-			body = ""
-		raise RuntimeError(f"HTTP {exc.code} {exc.reason}: {body}") from exc
+			conn.close()
+		except OSError:
+			pass
+
+
+def _get_json(url: str, extra_headers: Dict[str, str] | None = None) -> Dict[str, Any]:
+	parsed = urllib.parse.urlsplit(url)
+	path = parsed.path or "/"
+	if parsed.query:
+		path = f"{path}?{parsed.query}"
+	headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+	if extra_headers:
+		headers.update(extra_headers)
+	for attempt in (0, 1):
+		conn = _get_connection(parsed.scheme, parsed.netloc)
+		try:
+			conn.request("GET", path, headers=headers)
+			response = conn.getresponse()
+			text = response.read().decode("utf-8")
+		except (http.client.HTTPException, OSError) as exc:
+			# Stale keep-alive socket; rebuild the connection and retry once.
+			_drop_connection(parsed.scheme, parsed.netloc)
+			if attempt:
+				raise RuntimeError(f"GET {url} failed: {exc}") from exc
+			continue
+		if response.status >= 400:
+			raise RuntimeError(f"HTTP {response.status} {response.reason}: {text}")
+		return json.loads(text)
+
+
+def request_json(url: str, api_key: str) -> Dict[str, Any]:
+	return _get_json(url, {"Authorization": f"Bearer {api_key}"})
 
 
 def post_json(url: str, api_key: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-	request = urllib.request.Request(url, method="POST")
-	request.add_header("Authorization", f"Bearer {api_key}")
-	request.add_header("Content-Type", "application/json")
-	request.add_header(
-		"User-Agent",
-		"Mozilla/5.0 (compatible; PolywhalerBot/1.0; +https://workers.dev)",
-	)
-	body = json.dumps(payload).encode("utf-8")
-	try:
-		with urllib.request.urlopen(request, data=body, timeout=20) as response:
-			payload_text = response.read().decode("utf-8")
-			return json.loads(payload_text)
-	except urllib.error.HTTPError as exc:
-		body_text = ""
+	parsed = urllib.parse.urlsplit(url)
+	path = parsed.path or "/"
+	if parsed.query:
+		path = f"{path}?{parsed.query}"
+	body = _dumps_bytes(payload)
+	headers = {
+		"Authorization": f"Bearer {api_key}",
+		"Content-Type": "application/json",
+		"User-Agent": USER_AGENT,
+		"Connection": "keep-alive",
+	}
+	for attempt in (0, 1):
+		conn = _get_connection(parsed.scheme, parsed.netloc)
 		try:
-			body_text = exc.read().decode("utf-8")
-		except Exception:
-			body_text = ""
-		raise RuntimeError(f"HTTP {exc.code} {exc.reason}: {body_text}") from exc
+			conn.request("POST", path, body=body, headers=headers)
+			response = conn.getresponse()
+			text = response.read().decode("utf-8")
+		except (http.client.HTTPException, OSError) as exc:
+			# Stale keep-alive socket; rebuild the connection and retry once.
+			_drop_connection(parsed.scheme, parsed.netloc)
+			if attempt:
+				raise RuntimeError(f"POST {url} failed: {exc}") from exc
+			continue
+		if response.status >= 400:
+			raise RuntimeError(f"HTTP {response.status} {response.reason}: {text}")
+		return json.loads(text)
 
 def request_json_public(url: str) -> Dict[str, Any]:
-	request = urllib.request.Request(url)
-	request.add_header(
-		"User-Agent",
-		"Mozilla/5.0 (compatible; PolywhalerBot/1.0; +https://workers.dev)",
-	)
-	try:
-		with urllib.request.urlopen(request, timeout=20) as response:
-			payload = response.read().decode("utf-8")
-			return json.loads(payload)
-	except urllib.error.HTTPError as exc:
-		body = ""
-		try:
-			body = exc.read().decode("utf-8")
-		except Exception:
-			body = ""
-		raise RuntimeError(f"HTTP {exc.code} {exc.reason}: {body}") from exc
+	return _get_json(url)
 
 
 def fetch_candidates(config: BotConfig) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
@@ -343,23 +462,104 @@ def fetch_candidates(config: BotConfig) -> Tuple[List[Dict[str, Any]], Dict[str,
 	data = request_json(url, config.api_key)
 	return data.get("candidates", []), data.get("debug", {})
 
+_WS_RE = re.compile(r"\s+")
+_NORMALIZE_CACHE: collections.OrderedDict[str, str] = collections.OrderedDict()
+_NORMALIZE_CACHE_MAX = 1000
+
+
 def normalize_outcome(value: str) -> str:
-	return " ".join(value.strip().lower().split())
+	cached = _NORMALIZE_CACHE.get(value)
+	if cached is not None:
+		return cached
+	normalized = _WS_RE.sub(" ", value.strip().lower())
+	if len(_NORMALIZE_CACHE) >= _NORMALIZE_CACHE_MAX:
+		_NORMALIZE_CACHE.popitem(last=False)
+	_NORMALIZE_CACHE[value] = normalized
+	return normalized
 
 _token_cache: Dict[str, List[Dict[str, str]]] = {}
+_token_cache_ts: Dict[str, float] = {}
+_TOKEN_CACHE_PATH = os.getenv("BOT_TOKEN_CACHE_PATH", "bot/token_cache.json")
+_TOKEN_CACHE_TTL_SECONDS = 86400
+# Empty results are cached too, but only briefly: a not-yet-live market
+# should stop hammering the CLOB/gamma endpoints every poll, yet still be
+# retried once it may have gone live.
+_TOKEN_CACHE_NEGATIVE_TTL_SECONDS = 300
+
+
+def _cached_token_map(condition_id: str) -> List[Dict[str, str]] | None:
+	cached = _token_cache.get(condition_id)
+	if cached is None:
+		return None
+	if cached:
+		return cached
+	if time.time() - _token_cache_ts.get(condition_id, 0.0) < _TOKEN_CACHE_NEGATIVE_TTL_SECONDS:
+		return cached
+	return None
+
+
+def _load_token_cache() -> None:
+	try:
+		with open(_TOKEN_CACHE_PATH, "r", encoding="utf-8") as handle:
+			raw = json.load(handle)
+	except (FileNotFoundError, json.JSONDecodeError):
+		return
+	if not isinstance(raw, dict):
+		return
+	now = time.time()
+	for condition_id, row in raw.items():
+		if not isinstance(row, dict):
+			continue
+		ts = row.get("ts")
+		tokens = row.get("tokens")
+		if not isinstance(ts, (int, float)) or not isinstance(tokens, list):
+			continue
+		if now - ts > _TOKEN_CACHE_TTL_SECONDS:
+			continue
+		_token_cache[condition_id] = tokens
+		_token_cache_ts[condition_id] = float(ts)
+
+
+def _save_token_cache() -> None:
+	if not _token_cache:
+		return
+	payload = {
+		condition_id: {
+			"ts": _token_cache_ts.get(condition_id, time.time()),
+			"tokens": tokens,
+		}
+		for condition_id, tokens in _token_cache.items()
+		if tokens
+	}
+	if not payload:
+		return
+	try:
+		dirname = os.path.dirname(_TOKEN_CACHE_PATH)
+		if dirname:
+			os.makedirs(dirname, exist_ok=True)
+		with open(_TOKEN_CACHE_PATH, "w", encoding="utf-8") as handle:
+			json.dump(payload, handle)
+	except OSError:
+		return
+
+
+_load_token_cache()
+
+# The only event fields that ever carry floats needing rounding; gating on
+# this set skips the per-field isinstance check for everything else.
+_FLOAT_LOG_FIELDS = frozenset(
+	{"signalScore", "edgeRating", "microstructureScore", "price", "stake"}
+)
+
 
 def log_event(event_name: str, **fields: Any) -> None:
-	normalized: Dict[str, Any] = {}
-	for key, value in fields.items():
-		if isinstance(value, float):
-			normalized[key] = round(value, 6)
-		else:
-			normalized[key] = value
-	print(
-		"[bot]",
-		event_name,
-		json.dumps(normalized, ensure_ascii=True, separators=(",", ":"), sort_keys=True),
-	)
+	normalized = {
+		key: round(value, 6)
+		if key in _FLOAT_LOG_FIELDS and type(value) is float
+		else value
+		for key, value in fields.items()
+	}
+	print("[bot]", event_name, _dumps(normalized))
 
 def candidate_context(candidate: Dict[str, Any]) -> Dict[str, Any]:
 	entry = candidate.get("entry") or {}
@@ -386,8 +586,9 @@ def candidate_context(candidate: Dict[str, Any]) -> Dict[str, Any]:
 def fetch_clob_token_map(condition_id: str) -> List[Dict[str, str]]:
 	if not condition_id:
 		return []
-	if condition_id in _token_cache:
-		return _token_cache[condition_id]
+	cached = _cached_token_map(condition_id)
+	if cached is not None:
+		return cached
 	url = f"https://clob.polymarket.com/markets/{condition_id}"
 	try:
 		data = request_json_public(url)
@@ -402,15 +603,19 @@ def fetch_clob_token_map(condition_id: str) -> List[Dict[str, str]]:
 		token_id = token.get("token_id") or token.get("tokenId") or token.get("id")
 		if outcome and token_id:
 			mapped.append({"outcome": str(outcome), "token_id": str(token_id)})
+	# Empty results are not cached here: the gamma fallback writes the
+	# (possibly negative) shared entry once it has also been consulted.
 	if mapped:
 		_token_cache[condition_id] = mapped
+		_token_cache_ts[condition_id] = time.time()
 	return mapped
 
 def fetch_token_map(condition_id: str) -> List[Dict[str, str]]:
 	if not condition_id:
 		return []
-	if condition_id in _token_cache:
-		return _token_cache[condition_id]
+	cached = _cached_token_map(condition_id)
+	if cached is not None:
+		return cached
 	url = (
 		"https://gamma-api.polymarket.com/markets?"
 		+ urllib.parse.urlencode(
@@ -432,6 +637,7 @@ def fetch_token_map(condition_id: str) -> List[Dict[str, str]]:
 		markets = data["data"]
 	if not markets:
 		_token_cache[condition_id] = []
+		_token_cache_ts[condition_id] = time.time()
 		return []
 	market = markets[0] or {}
 	tokens = market.get("tokens") or []
@@ -452,8 +658,22 @@ def fetch_token_map(condition_id: str) -> List[Dict[str, str]]:
 		if outcome and token_id:
 			mapped.append({"outcome": str(outcome), "token_id": str(token_id)})
 	_token_cache[condition_id] = mapped
+	_token_cache_ts[condition_id] = time.time()
 	return mapped
 
+def prefetch_token_maps(candidates: List[Dict[str, Any]]) -> None:
+	condition_ids: List[str] = []
+	for candidate in candidates:
+		entry = candidate.get("entry") or {}
+		condition_id = entry.get("conditionId")
+		if condition_id and condition_id not in _token_cache and condition_id not in condition_ids:
+			condition_ids.append(condition_id)
+	if not condition_ids:
+		return
+	with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+		list(pool.map(fetch_clob_token_map, condition_ids))
+
+
 def resolve_token_id(entry: Dict[str, Any]) -> str:
 	condition_id = entry.get("conditionId")
 	if not condition_id:
@@ -469,11 +689,12 @@ def resolve_token_id(entry: Dict[str, Any]) -> str:
 	target_label = side_a if sharp_side == "A" else side_b if sharp_side == "B" else ""
 	if target_label:
 		target = normalize_outcome(target_label)
-		for token in tokens:
-			if normalize_outcome(token["outcome"]) == target:
+		normalized_outcomes = [normalize_outcome(token["outcome"]) for token in tokens]
+		for token, outcome in zip(tokens, normalized_outcomes):
+			if outcome == target:
 				return token["token_id"]
-		for token in tokens:
-			if target in normalize_outcome(token["outcome"]):
+		for token, outcome in zip(tokens, normalized_outcomes):
+			if target in outcome:
 				return token["token_id"]
 	if len(tokens) == 2 and sharp_side in ("A", "B"):
 		return tokens[0]["token_id"] if sharp_side == "A" else tokens[1]["token_id"]
@@ -585,18 +806,21 @@ def execute_live_trade(
 	response = client.post_order(signed, OrderType.FOK)
 	return {"token_id": token_id, "response": response}
 
+_RAY_ID_STRONG = re.compile(r"Cloudflare Ray ID:\s*<strong[^>]*>([^<]+)</strong>")
+_RAY_ID_PLAIN = re.compile(r"Cloudflare Ray ID:\s*([A-Za-z0-9]+)")
+
+
 def extract_cloudflare_ray_id(error_text: str) -> str | None:
-	match = re.search(r"Cloudflare Ray ID:\\s*<strong[^>]*>([^<]+)</strong>", error_text)
+	match = _RAY_ID_STRONG.search(error_text)
 	if match:
 		return match.group(1).strip()
-	match = re.search(r"Cloudflare Ray ID:\\s*([A-Za-z0-9]+)", error_text)
+	match = _RAY_ID_PLAIN.search(error_text)
 	if match:
 		return match.group(1).strip()
 	return None
 
 def get_local_time_components(tz_name: str) -> tuple[int, int] | None:
 	try:
-		import datetime
 		import zoneinfo
 
 		tz = zoneinfo.ZoneInfo(tz_name)
@@ -629,19 +853,17 @@ def is_within_window(
 	start_minutes = start[0] * 60 + start[1]
 	end_minutes = end[0] * 60 + end[1]
 	now_minutes = now_h * 60 + now_m
-	if start_minutes <= end_minutes:
-		return start_minutes <= now_minutes <= end_minutes
-	return now_minutes >= start_minutes or now_minutes <= end_minutes
+	# Branchless wrap-around: distance from start (mod one day) must not
+	# exceed the window length (mod one day).
+	return (now_minutes - start_minutes) % 1440 <= (end_minutes - start_minutes) % 1440
+
+_RNG = random.Random()
+
 
 def apply_jitter(base_seconds: float, ratio: float) -> float:
 	if ratio <= 0:
 		return base_seconds
-	try:
-		import random
-		delta = base_seconds * ratio
-		return max(1.0, base_seconds + random.uniform(-delta, delta))
-	except Exception:
-		return base_seconds
+	return max(1.0, base_seconds * (1.0 + ratio * (2.0 * _RNG.random() - 1.0)))
 
 def run_preflight(config: BotConfig) -> None:
 	if config.dry_run:
@@ -688,10 +910,32 @@ def run_preflight(config: BotConfig) -> None:
 		else:
 			print("[preflight] conditional token balance/allowance: unavailable")
 
+_trade_log_handle: TextIO | None = None
+_trade_log_path_seen: str | None = None
+
+
 def append_trade_log(path: str, payload: Dict[str, Any]) -> None:
-	os.makedirs(os.path.dirname(path), exist_ok=True)
-	with open(path, "a", encoding="utf-8") as handle:
-		handle.write(json.dumps(payload) + "\n")
+	global _trade_log_handle, _trade_log_path_seen
+	if _trade_log_handle is None or _trade_log_path_seen != path:
+		if _trade_log_handle is not None:
+			try:
+				_trade_log_handle.close()
+			except OSError:
+				pass
+		dirname = os.path.dirname(path)
+		if dirname:
+			os.makedirs(dirname, exist_ok=True)
+		_trade_log_handle = open(path, "a", encoding="utf-8", buffering=8192)
+		_trade_log_path_seen = path
+	_trade_log_handle.write(_dumps(payload) + "\n")
+
+
+def flush_trade_log() -> None:
+	if _trade_log_handle is not None:
+		try:
+			_trade_log_handle.flush()
+		except OSError:
+			pass
 
 
 GRADE_PROB_DEFAULTS = {
@@ -810,6 +1054,7 @@ def place_bet(
 				if config.stop_on_403:
 					print(colorize("[bot]", COLOR_YELLOW), "stopping on Cloudflare block")
 					append_trade_log(config.trade_log_path, trade)
+					flush_trade_log()
 					sys.exit(1)
 			print(colorize("[error]", COLOR_RED), "live trade failed; defaulting to paper:", exc)
 
@@ -876,8 +1121,10 @@ def run_loop() -> None:
 
 	window_start = parse_time_window(config.run_window_start)
 	window_end = parse_time_window(config.run_window_end)
-	call_timestamps: List[float] = []
+	verbose = _env("BOT_VERBOSE", "false", _flag_true)
+	call_timestamps: collections.deque[float] = collections.deque()
 	backoff = 0.0
+	state_dirty = False
 
 	while True:
 		try:
@@ -896,14 +1143,18 @@ def run_loop() -> None:
 						continue
 
 			now = time.time()
-			placed_meta = prune_placed_meta(
+			pruned_meta = prune_placed_meta(
 				placed_meta,
 				int(now),
 				config.placed_ttl_seconds,
 				config.placed_event_grace_seconds,
 			)
-			placed = set(placed_meta.keys())
-			call_timestamps = [t for t in call_timestamps if now - t < 3600]
+			if len(pruned_meta) != len(placed_meta):
+				state_dirty = True
+				placed_meta = pruned_meta
+				placed = set(placed_meta.keys())
+			while call_timestamps and now - call_timestamps[0] >= 3600:
+				call_timestamps.popleft()
 			if config.max_calls_per_hour > 0 and len(call_timestamps) >= config.max_calls_per_hour:
 				sleep_seconds = apply_jitter(config.poll_seconds, config.poll_jitter_ratio)
 				print("[bot] rate cap reached, sleeping", round(sleep_seconds, 1))
@@ -927,6 +1178,8 @@ def run_loop() -> None:
 			call_timestamps.append(time.time())
 			candidates, candidate_debug = fetch_candidates(config)
 			print("[bot] candidates", len(candidates))
+			if not config.dry_run and candidates:
+				prefetch_token_maps(candidates)
 			if len(candidates) == 0 and isinstance(candidate_debug, dict):
 				excluded = candidate_debug.get("excluded") or {}
 				total_entries = candidate_debug.get("totalEntries")
@@ -940,34 +1193,49 @@ def run_loop() -> None:
 					dedupReasons=candidate_debug.get("dedupReasons"),
 				)
 			new_bets = 0
-			skipped_already_placed = 0
-			skipped_missing_condition = 0
-			for idx, candidate in enumerate(candidates, start=1):
-				entry = candidate.get("entry") or {}
-				condition_id = entry.get("conditionId")
-				log_event("candidate", idx=idx, **candidate_context(candidate))
-				if not condition_id:
-					skipped_missing_condition += 1
+			condition_ids = [
+				(candidate.get("entry") or {}).get("conditionId")
+				for candidate in candidates
+			]
+			missing = [i for i, cid in enumerate(condition_ids) if not cid]
+			already = [i for i, cid in enumerate(condition_ids) if cid and cid in placed]
+			ready = [i for i, cid in enumerate(condition_ids) if cid and cid not in placed]
+			skipped_missing_condition = len(missing)
+			skipped_already_placed = len(already)
+			if verbose:
+				for i, candidate in enumerate(candidates, start=1):
+					log_event("candidate", idx=i, **candidate_context(candidate))
+				for i in missing:
 					log_event(
 						"candidate_skip_missing_condition_id",
-						idx=idx,
-						**candidate_context(candidate),
+						idx=i + 1,
+						**candidate_context(candidates[i]),
 					)
-					continue
-				if condition_id in placed:
-					skipped_already_placed += 1
-					placed_row = placed_meta.get(condition_id) or {}
+				for i in already:
+					placed_row = placed_meta.get(condition_ids[i]) or {}
 					log_event(
 						"candidate_skip_already_placed",
-						idx=idx,
+						idx=i + 1,
 						placedAt=placed_row.get("placedAt"),
 						placedEventTime=placed_row.get("eventTime"),
-						**candidate_context(candidate),
+						**candidate_context(candidates[i]),
 					)
+			else:
+				if missing:
+					log_event("candidate_skip_missing_condition_id", count=len(missing))
+				if already:
+					log_event("candidate_skip_already_placed", count=len(already))
+			for i in ready:
+				candidate = candidates[i]
+				entry = candidate.get("entry") or {}
+				condition_id = condition_ids[i]
+				if condition_id in placed:
+					# Duplicate condition ID later in the same batch.
+					skipped_already_placed += 1
 					continue
 				log_event(
 					"candidate_considering",
-					idx=idx,
+					idx=i + 1,
 					**candidate_context(candidate),
 				)
 				did_place = place_bet(candidate, config, state)
@@ -978,6 +1246,7 @@ def run_loop() -> None:
 						"eventTime": entry.get("eventTime"),
 					}
 					new_bets += 1
+					state_dirty = True
 					if new_bets >= config.max_bets:
 						print("[bot] max bets reached", config.max_bets)
 						break
@@ -988,9 +1257,12 @@ def run_loop() -> None:
 				skippedMissingConditionId=skipped_missing_condition,
 				newPlaced=new_bets,
 			)
-			state["placed"] = sorted(placed)
-			state["placedMeta"] = placed_meta
-			save_state(config.state_path, state)
+			flush_trade_log()
+			if state_dirty:
+				state["placed"] = list(placed)
+				state["placedMeta"] = placed_meta
+				save_state(config.state_path, state)
+				state_dirty = False
 		except Exception as exc:
 			print("[bot] error:", exc)
 			if config.poll_backoff_base > 0:
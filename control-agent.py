@@ -1,14 +1,36 @@
 #!/usr/bin/env python3
+import hmac
 import json
 import os
+import re
+import selectors
+import socket
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 from urllib.parse import parse_qs, urlparse
 
+try:
+	import orjson
+
+	def _dumps(payload: Any) -> bytes:
+		return orjson.dumps(payload)
+
+	_loads = orjson.loads
+except ImportError:
+
+	def _dumps(payload: Any) -> bytes:
+		return json.dumps(payload).encode("utf-8")
+
+	_loads = json.loads
+
 SERVICE_NAME = os.environ.get("BOT_SERVICE_NAME", "polywhaler-bot")
 CONTROL_TOKEN = os.environ.get("CONTROL_TOKEN", "")
+_CONTROL_TOKEN_BYTES = CONTROL_TOKEN.encode("utf-8")
 CONTROL_BIND = os.environ.get("CONTROL_BIND", "127.0.0.1")
 CONTROL_PORT = int(os.environ.get("CONTROL_PORT", "9102"))
 CONTROL_LOG_LINES_DEFAULT = int(os.environ.get("CONTROL_LOG_LINES_DEFAULT", "200"))
@@ -19,10 +41,13 @@ CONTROL_ENV_ALLOWLIST = {
 	for key in os.environ.get("CONTROL_ENV_ALLOWLIST", "").split(",")
 	if key.strip()
 }
+CONTROL_ENV_ALLOWLIST_SORTED = sorted(CONTROL_ENV_ALLOWLIST)
+CONTROL_HTTP_THREADS = int(os.environ.get("CONTROL_HTTP_THREADS", "16"))
+CONTROL_STATUS_TTL_MS = int(os.environ.get("CONTROL_STATUS_TTL_MS", "500"))
+CONTROL_WORKERS = max(1, int(os.environ.get("CONTROL_WORKERS", "1")))
 
 
-def json_response(handler: BaseHTTPRequestHandler, status: int, payload: dict) -> None:
-	data = json.dumps(payload).encode("utf-8")
+def json_bytes_response(handler: BaseHTTPRequestHandler, status: int, data: bytes) -> None:
 	handler.send_response(status)
 	handler.send_header("Content-Type", "application/json")
 	handler.send_header("Cache-Control", "no-store")
@@ -31,52 +56,117 @@ def json_response(handler: BaseHTTPRequestHandler, status: int, payload: dict) -
 	handler.wfile.write(data)
 
 
+def json_response(handler: BaseHTTPRequestHandler, status: int, payload: dict) -> None:
+	json_bytes_response(handler, status, _dumps(payload))
+
+
+# Pre-encoded bodies for the fixed error payloads, so unauthorized scan
+# traffic and bad requests skip json.dumps entirely.
+_STATIC_JSON = {
+	key: _dumps({"error": key})
+	for key in (
+		"unauthorized",
+		"not_found",
+		"env_not_configured",
+		"invalid_json",
+		"invalid_updates",
+		"no_allowed_updates",
+	)
+}
+
+
+def error_response(handler: BaseHTTPRequestHandler, status: int, key: str) -> None:
+	json_bytes_response(handler, status, _STATIC_JSON[key])
+
+
+_BEARER_RE = re.compile(r"(?i)^bearer\s+(\S+)")
+
+
 def require_auth(handler: BaseHTTPRequestHandler) -> bool:
 	auth_header = handler.headers.get("Authorization", "")
-	token = ""
-	if auth_header.lower().startswith("bearer "):
-		token = auth_header[7:].strip()
+	match = _BEARER_RE.match(auth_header)
+	if match:
+		token = match.group(1)
 	else:
 		token = handler.headers.get("X-Control-Token", "")
-	return bool(CONTROL_TOKEN) and token == CONTROL_TOKEN
+	return bool(CONTROL_TOKEN) and hmac.compare_digest(
+		token.encode("utf-8"), _CONTROL_TOKEN_BYTES
+	)
 
 
 def run_command(args: List[str]) -> Tuple[int, str, str]:
 	process = subprocess.run(
 		args,
-		text=True,
-		capture_output=True,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+		bufsize=1 << 16,
 	)
-	return process.returncode, process.stdout, process.stderr
+	return (
+		process.returncode,
+		process.stdout.decode("utf-8", "replace"),
+		process.stderr.decode("utf-8", "replace"),
+	)
+
+
+_status_cache: dict = {"t": 0.0, "v": None}
+_status_lock = threading.Lock()
+
+
+def invalidate_status_cache() -> None:
+	with _status_lock:
+		_status_cache["t"] = 0.0
+		_status_cache["v"] = None
 
 
 def get_status() -> dict:
-	code, stdout, stderr = run_command(
-		[
-			"systemctl",
-			"show",
-			SERVICE_NAME,
-			"--no-page",
-			"-p",
-			"ActiveState",
-			"-p",
-			"SubState",
-			"-p",
-			"ExecMainStatus",
-			"-p",
-			"MainPID",
-			"-p",
-			"ExecMainStartTimestamp",
-		],
-	)
-	if code != 0:
-		return {"service": SERVICE_NAME, "error": stderr.strip() or "status_failed"}
-	payload: Dict[str, str] = {}
-	for line in stdout.splitlines():
-		if "=" not in line:
-			continue
-		key, value = line.split("=", 1)
-		payload[key] = value
+	ttl = CONTROL_STATUS_TTL_MS / 1000.0
+	with _status_lock:
+		cached = _status_cache["v"]
+		if cached is not None and time.monotonic() - _status_cache["t"] < ttl:
+			return cached
+	status = _fetch_status()
+	with _status_lock:
+		_status_cache["t"] = time.monotonic()
+		_status_cache["v"] = status
+	return status
+
+
+_STATUS_ARGS = [
+	"systemctl",
+	"show",
+	SERVICE_NAME,
+	"--no-page",
+	"-p",
+	"ActiveState",
+	"-p",
+	"SubState",
+	"-p",
+	"ExecMainStatus",
+	"-p",
+	"MainPID",
+	"-p",
+	"ExecMainStartTimestamp",
+]
+
+
+def _fetch_status() -> dict:
+	payload: Dict[str, Any] | None = None
+	code, stdout, stderr = run_command(_STATUS_ARGS + ["--output=json"])
+	if code == 0 and stdout.lstrip().startswith("{"):
+		try:
+			payload = _loads(stdout)
+		except ValueError:
+			payload = None
+	if payload is None:
+		# Older systemd without --output=json; fall back to key=value.
+		code, stdout, stderr = run_command(_STATUS_ARGS)
+		if code != 0:
+			return {"service": SERVICE_NAME, "error": stderr.strip() or "status_failed"}
+		payload = {}
+		for line in stdout.split("\n"):
+			key, sep, value = line.partition("=")
+			if sep:
+				payload[key] = value
 	return {
 		"service": SERVICE_NAME,
 		"activeState": payload.get("ActiveState", "unknown"),
@@ -93,11 +183,31 @@ def clamp_log_lines(value: int) -> int:
 	return min(value, CONTROL_LOG_LINES_MAX)
 
 
+# Parsed env files keyed by path; each entry stores the (mtime_ns, size)
+# stamp it was parsed under so edits on disk invalidate it.
+_env_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, str]]] = {}
+
+
 def read_env_file(path: str) -> Dict[str, str]:
 	result: Dict[str, str] = {}
-	if not path or not os.path.exists(path):
+	if not path:
+		return result
+	try:
+		stat = os.stat(path)
+		stamp = (stat.st_mtime_ns, stat.st_size)
+	except FileNotFoundError:
+		return result
+	except OSError:
+		stamp = None
+	if stamp is not None:
+		hit = _env_cache.get(path)
+		if hit is not None and hit[0] == stamp:
+			return hit[1]
+	try:
+		handle = open(path, "r", encoding="utf-8")
+	except FileNotFoundError:
 		return result
-	with open(path, "r", encoding="utf-8") as handle:
+	with handle:
 		for line in handle:
 			stripped = line.strip()
 			if not stripped or stripped.startswith("#") or "=" not in stripped:
@@ -111,13 +221,18 @@ def read_env_file(path: str) -> Dict[str, str]:
 				value = value[1:-1]
 			if key in CONTROL_ENV_ALLOWLIST:
 				result[key] = value
+	if stamp is not None:
+		_env_cache[path] = (stamp, result)
 	return result
 
 
+_NEEDS_QUOTES_RE = re.compile(r"[\s#=]")
+
+
 def serialize_env_value(value: str) -> str:
 	if value == "":
 		return '""'
-	needs_quotes = any(ch.isspace() for ch in value) or "#" in value or "=" in value
+	needs_quotes = _NEEDS_QUOTES_RE.search(value) is not None
 	if not needs_quotes:
 		return value
 	escaped = value.replace("\\", "\\\\").replace('"', '\\"')
@@ -127,34 +242,53 @@ def serialize_env_value(value: str) -> str:
 def update_env_file(path: str, updates: Dict[str, str]) -> Dict[str, str]:
 	if not path:
 		raise ValueError("env_file_not_configured")
-	lines: List[str] = []
-	if os.path.exists(path):
-		with open(path, "r", encoding="utf-8") as handle:
-			lines = handle.readlines()
-	found = set()
-	for index, line in enumerate(lines):
-		stripped = line.strip()
-		if not stripped or stripped.startswith("#") or "=" not in stripped:
-			continue
-		key, _value = stripped.split("=", 1)
-		key = key.strip()
-		if key in updates:
-			lines[index] = f"{key}={serialize_env_value(updates[key])}\n"
-			found.add(key)
-	for key, value in updates.items():
-		if key not in found:
-			lines.append(f"{key}={serialize_env_value(value)}\n")
-	with tempfile.NamedTemporaryFile("w", delete=False, encoding="utf-8") as handle:
-		handle.writelines(lines)
-		temp_path = handle.name
+	remaining = dict(updates)
+	# Create the temp file next to the target: $TMPDIR can be a different
+	# filesystem, where os.replace degrades from a rename to copy+unlink.
+	dirname = os.path.dirname(os.path.abspath(path))
+	fd, temp_path = tempfile.mkstemp(dir=dirname, prefix=".env.", suffix=".tmp")
+	try:
+		with os.fdopen(fd, "w", encoding="utf-8") as out:
+			try:
+				with open(path, "r", encoding="utf-8") as source:
+					for line in source:
+						stripped = line.strip()
+						if stripped and not stripped.startswith("#") and "=" in stripped:
+							key = stripped.split("=", 1)[0].strip()
+							if key in remaining:
+								out.write(f"{key}={serialize_env_value(remaining.pop(key))}\n")
+								continue
+						out.write(line)
+			except FileNotFoundError:
+				pass
+			for key, value in remaining.items():
+				out.write(f"{key}={serialize_env_value(value)}\n")
+			out.flush()
+			os.fsync(out.fileno())
+	except BaseException:
+		os.unlink(temp_path)
+		raise
 	os.replace(temp_path, path)
+	_env_cache.pop(path, None)
 	return read_env_file(path)
 
 
 class ControlHandler(BaseHTTPRequestHandler):
+	# HTTP/1.1 is required for the chunked /logs response; keep idle
+	# keep-alive connections from pinning pool workers forever.
+	protocol_version = "HTTP/1.1"
+	timeout = 60
+
+	def write_chunk(self, data: bytes) -> None:
+		if data:
+			self.wfile.write(b"%X\r\n" % len(data) + data + b"\r\n")
+
+	def end_chunks(self) -> None:
+		self.wfile.write(b"0\r\n\r\n")
+
 	def do_GET(self) -> None:
 		if not require_auth(self):
-			return json_response(self, 401, {"error": "unauthorized"})
+			return error_response(self, 401, "unauthorized")
 
 		parsed = urlparse(self.path)
 		path = parsed.path
@@ -165,7 +299,7 @@ class ControlHandler(BaseHTTPRequestHandler):
 
 		if path == "/logs":
 			lines = clamp_log_lines(int(query.get("lines", [CONTROL_LOG_LINES_DEFAULT])[0]))
-			code, stdout, stderr = run_command(
+			process = subprocess.Popen(
 				[
 					"journalctl",
 					"-u",
@@ -176,10 +310,53 @@ class ControlHandler(BaseHTTPRequestHandler):
 					"-o",
 					"short-iso",
 				],
+				stdout=subprocess.PIPE,
+				stderr=subprocess.PIPE,
+				bufsize=1 << 16,
 			)
-			if code != 0:
-				return json_response(self, 500, {"error": stderr.strip() or "logs_failed"})
-			return json_response(self, 200, {"lines": [line for line in stdout.splitlines()]})
+			assert process.stdout is not None
+			# Peek one line so a failing journalctl can still produce a
+			# proper 500 before the chunked 200 is committed.
+			first_line = process.stdout.readline()
+			if not first_line and process.wait() != 0:
+				stderr = b""
+				if process.stderr is not None:
+					stderr = process.stderr.read()
+				return json_response(
+					self,
+					500,
+					{"error": stderr.decode("utf-8", "replace").strip() or "logs_failed"},
+				)
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Cache-Control", "no-store")
+			self.send_header("Transfer-Encoding", "chunked")
+			self.end_headers()
+			try:
+				buf = bytearray(b'{"lines":[')
+				first = True
+				line = first_line
+				while line:
+					if first:
+						first = False
+					else:
+						buf += b","
+					buf += _dumps(line.rstrip(b"\n").decode("utf-8", "replace"))
+					if len(buf) >= 16384:
+						self.write_chunk(bytes(buf))
+						buf.clear()
+					line = process.stdout.readline()
+				buf += b"]}"
+				self.write_chunk(bytes(buf))
+				self.end_chunks()
+			except BrokenPipeError:
+				pass
+			finally:
+				process.stdout.close()
+				if process.stderr is not None:
+					process.stderr.close()
+				process.wait()
+			return
 
 		if path == "/logs/stream":
 			lines = clamp_log_lines(int(query.get("lines", [CONTROL_LOG_LINES_DEFAULT])[0]))
@@ -202,24 +379,59 @@ class ControlHandler(BaseHTTPRequestHandler):
 					"short-iso",
 				],
 				stdout=subprocess.PIPE,
-				stderr=subprocess.PIPE,
-				text=True,
+				stderr=subprocess.DEVNULL,
 			)
+			assert process.stdout is not None
+			fd = process.stdout.fileno()
+			os.set_blocking(fd, False)
+			selector = selectors.DefaultSelector()
+			selector.register(fd, selectors.EVENT_READ, "journal")
+			selector.register(self.connection, selectors.EVENT_READ, "client")
 			try:
-				assert process.stdout is not None
-				for line in process.stdout:
-					payload = f"data: {line.rstrip()}\n\n"
-					self.wfile.write(payload.encode("utf-8"))
+				buf = bytearray()
+				pending = b""
+				last_flush = time.monotonic()
+				done = False
+				while not done:
+					for key, _mask in selector.select(timeout=0.05):
+						if key.data == "client":
+							# SSE clients never send again on this socket;
+							# readable here means the peer hung up.
+							done = True
+							break
+						try:
+							chunk = os.read(fd, 65536)
+						except BlockingIOError:
+							continue
+						if not chunk:
+							done = True
+							break
+						pending += chunk
+						parts = pending.split(b"\n")
+						pending = parts.pop()
+						for raw_line in parts:
+							buf += b"data: " + raw_line.rstrip(b"\r") + b"\n\n"
+					now = time.monotonic()
+					if buf and (len(buf) >= 16384 or now - last_flush > 0.05):
+						self.wfile.write(buf)
+						self.wfile.flush()
+						buf.clear()
+						last_flush = now
+				if buf:
+					self.wfile.write(buf)
 					self.wfile.flush()
 			except BrokenPipeError:
 				pass
 			finally:
+				selector.close()
+				self.close_connection = True
 				process.terminate()
+				process.wait()
 			return
 
 		if path == "/env":
 			if not CONTROL_ENV_FILE or not CONTROL_ENV_ALLOWLIST:
-				return json_response(self, 404, {"error": "env_not_configured"})
+				return error_response(self, 404, "env_not_configured")
 			payload = read_env_file(CONTROL_ENV_FILE)
 			return json_response(
 				self,
@@ -227,15 +439,15 @@ class ControlHandler(BaseHTTPRequestHandler):
 				{
 					"env": payload,
 					"path": CONTROL_ENV_FILE,
-					"allowlist": sorted(CONTROL_ENV_ALLOWLIST),
+					"allowlist": CONTROL_ENV_ALLOWLIST_SORTED,
 				},
 			)
 
-		return json_response(self, 404, {"error": "not_found"})
+		return error_response(self, 404, "not_found")
 
 	def do_POST(self) -> None:
 		if not require_auth(self):
-			return json_response(self, 401, {"error": "unauthorized"})
+			return error_response(self, 401, "unauthorized")
 
 		parsed = urlparse(self.path)
 		path = parsed.path
@@ -243,29 +455,30 @@ class ControlHandler(BaseHTTPRequestHandler):
 		if path in ("/start", "/stop", "/restart"):
 			action = path[1:]
 			code, _stdout, stderr = run_command(["systemctl", action, SERVICE_NAME])
+			invalidate_status_cache()
 			if code != 0:
 				return json_response(self, 500, {"error": stderr.strip() or "action_failed"})
 			return json_response(self, 200, get_status())
 
 		if path == "/env":
 			if not CONTROL_ENV_FILE or not CONTROL_ENV_ALLOWLIST:
-				return json_response(self, 404, {"error": "env_not_configured"})
+				return error_response(self, 404, "env_not_configured")
 			content_length = int(self.headers.get("Content-Length", "0") or "0")
 			body = self.rfile.read(content_length).decode("utf-8")
 			try:
 				payload = json.loads(body) if body else {}
 			except json.JSONDecodeError:
-				return json_response(self, 400, {"error": "invalid_json"})
+				return error_response(self, 400, "invalid_json")
 			updates = payload.get("updates", {})
 			if not isinstance(updates, dict):
-				return json_response(self, 400, {"error": "invalid_updates"})
+				return error_response(self, 400, "invalid_updates")
 			filtered = {
 				key: str(value)
 				for key, value in updates.items()
 				if key in CONTROL_ENV_ALLOWLIST
 			}
 			if not filtered:
-				return json_response(self, 400, {"error": "no_allowed_updates"})
+				return error_response(self, 400, "no_allowed_updates")
 			try:
 				env_payload = update_env_file(CONTROL_ENV_FILE, filtered)
 			except Exception as exc:
@@ -276,22 +489,65 @@ class ControlHandler(BaseHTTPRequestHandler):
 				{
 					"env": env_payload,
 					"path": CONTROL_ENV_FILE,
-					"allowlist": sorted(CONTROL_ENV_ALLOWLIST),
+					"allowlist": CONTROL_ENV_ALLOWLIST_SORTED,
 				},
 			)
 
-		return json_response(self, 404, {"error": "not_found"})
+		return error_response(self, 404, "not_found")
 
 	def log_message(self, format: str, *args) -> None:
 		return
 
 
+class PooledHTTPServer(ThreadingHTTPServer):
+	"""ThreadingHTTPServer that dispatches into a bounded worker pool
+	instead of spawning one thread per connection."""
+
+	def __init__(self, *args, **kwargs) -> None:
+		super().__init__(*args, **kwargs)
+		self.pool = ThreadPoolExecutor(max_workers=CONTROL_HTTP_THREADS)
+
+	def server_bind(self) -> None:
+		# Let multiple worker processes share the port; the kernel spreads
+		# accepts across them. Not available on every platform.
+		if CONTROL_WORKERS > 1 and hasattr(socket, "SO_REUSEPORT"):
+			self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+		super().server_bind()
+
+	def process_request(self, request, client_address) -> None:
+		self.pool.submit(self._handle, request, client_address)
+
+	def _handle(self, request, client_address) -> None:
+		try:
+			self.finish_request(request, client_address)
+		except Exception:
+			self.handle_error(request, client_address)
+		finally:
+			self.shutdown_request(request)
+
+
 def main() -> None:
 	if not CONTROL_TOKEN:
 		raise SystemExit("CONTROL_TOKEN is required")
-	server = ThreadingHTTPServer((CONTROL_BIND, CONTROL_PORT), ControlHandler)
-	print(f"control-agent listening on {CONTROL_BIND}:{CONTROL_PORT}")
-	server.serve_forever()
+	workers = CONTROL_WORKERS if hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork") else 1
+	is_parent = True
+	for _ in range(workers - 1):
+		if os.fork() == 0:
+			is_parent = False
+			break
+	server = PooledHTTPServer((CONTROL_BIND, CONTROL_PORT), ControlHandler)
+	if is_parent:
+		print(f"control-agent listening on {CONTROL_BIND}:{CONTROL_PORT} ({workers} worker(s))")
+	try:
+		server.serve_forever()
+	finally:
+		if is_parent:
+			while workers > 1:
+				try:
+					os.wait()
+				except ChildProcessError:
+					break
+				workers -= 1
 
 
 if __name__ == "__main__":